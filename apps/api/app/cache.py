@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Dict
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+
+
+class ResponseCache:
+    """
+    Bounded LRU of serialized JSON bodies, keyed by ETag.
+
+    Every cacheable resource belongs to a scope ("fee-maps", "invoice:12", ...)
+    with a version counter. The ETag is derived from (process epoch, scope
+    version, path + query), so bumping the scope's version after a write makes
+    all older entries unreachable; they simply age out of the LRU. The epoch
+    keeps ETags from one process from validating against another's counters.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._epoch = uuid.uuid4().hex[:8]
+        self._versions: Dict[str, int] = {}
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self, scope: str) -> int:
+        return self._versions.get(scope, 0)
+
+    def bump(self, *scopes: str) -> None:
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def etag(self, scope: str, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return f'"{self._epoch}-{self.version(scope)}-{digest}"'
+
+    def get(self, etag: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is not None:
+                self._entries.move_to_end(etag)
+            return body
+
+    def put(self, etag: str, body: bytes) -> None:
+        with self._lock:
+            self._entries[etag] = body
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drop every entry (used to isolate tests). Versions are kept, so ETags
+        already handed out never validate against new content.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def invoice_scope(invoice_id: int) -> str:
+    return f"invoice:{invoice_id}"
+
+
+FEE_MAPS_SCOPE = "fee-maps"
+# Anything that can change which fee_type_raw values are unknown
+# (upload, normalize, fee-map create) bumps this.
+FEE_SUGGESTIONS_SCOPE = "fee-suggestions"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def cached_json(request: Request, scope: str, build: Callable[[], Any]) -> Response:
+    """
+    Serve build()'s JSON from the cache, or 304 if the client already has it.
+    build() only runs (and only touches the DB) on a miss; exceptions it
+    raises (e.g. 404) are not cached.
+    """
+    key = request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+    etag = response_cache.etag(scope, key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(etag)
+    if body is None:
+        body = json.dumps(jsonable_encoder(build())).encode("utf-8")
+        response_cache.put(etag, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,12 +1,16 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Body, Query, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Body, Query, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, case
 import csv, io, json, re
+from datetime import date
 from typing import Optional, Dict, Any
 
 from .db import engine, Base, get_db
-from .models import InvoiceUpload, InvoiceLineItem, FeeTypeMap  # <-- add FeeTypeMap
+from .models import InvoiceUpload, InvoiceLineItem, FeeTypeMap, RateCard
+from .suggestions import get_suggestion_index
+from .rates import get_rate_index, invalidate_rate_index
+from .cache import response_cache, cached_json, invoice_scope, FEE_MAPS_SCOPE, FEE_SUGGESTIONS_SCOPE
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -18,6 +22,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 @app.on_event("startup")
@@ -132,6 +137,16 @@ def match_fee_type(fee_raw: str, maps: list["FeeTypeMap"]) -> Optional[str]:
     return None
 
 
+def parse_iso_date(s: Any, field: str) -> date:
+    """
+    Parse 'YYYY-MM-DD' or raise a 400.
+    """
+    try:
+        return date.fromisoformat(str(s).strip())
+    except (TypeError, ValueError):
+        raise HTTPException(400, f"{field} must be an ISO date (YYYY-MM-DD)")
+
+
 # -------------------------
 # Health
 # -------------------------
@@ -263,6 +278,7 @@ async def upload(
     invoice.valid_rows = inserted
     invoice.invalid_rows = invalid
     db.commit()
+    response_cache.bump(invoice_scope(invoice.id), FEE_SUGGESTIONS_SCOPE)
 
     return {
         "invoice_id": invoice.id,
@@ -280,21 +296,24 @@ async def upload(
 # Invoice metadata
 # -------------------------
 @app.get("/invoices/{invoice_id}")
-def get_invoice(invoice_id: int, db: Session = Depends(get_db)):
-    invoice = db.get(InvoiceUpload, invoice_id)
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
+def get_invoice(invoice_id: int, request: Request, db: Session = Depends(get_db)):
+    def build():
+        invoice = db.get(InvoiceUpload, invoice_id)
+        if not invoice:
+            raise HTTPException(status_code=404, detail="Invoice not found")
+
+        return {
+            "invoice_id": invoice.id,
+            "filename": invoice.filename,
+            "created_at": invoice.created_at.isoformat(),
+            "headers": json.loads(invoice.headers_json or "[]"),
+            "field_map": json.loads(invoice.field_map_json or "{}"),
+            "total_rows": invoice.total_rows or 0,
+            "valid_rows": invoice.valid_rows or 0,
+            "invalid_rows": invoice.invalid_rows or 0,
+        }
 
-    return {
-        "invoice_id": invoice.id,
-        "filename": invoice.filename,
-        "created_at": invoice.created_at.isoformat(),
-        "headers": json.loads(invoice.headers_json or "[]"),
-        "field_map": json.loads(invoice.field_map_json or "{}"),
-        "total_rows": invoice.total_rows or 0,
-        "valid_rows": invoice.valid_rows or 0,
-        "invalid_rows": invoice.invalid_rows or 0,
-    }
+    return cached_json(request, invoice_scope(invoice_id), build)
 
 
 # -------------------------
@@ -303,6 +322,7 @@ def get_invoice(invoice_id: int, db: Session = Depends(get_db)):
 @app.get("/invoices/{invoice_id}/items")
 def list_items(
     invoice_id: int,
+    request: Request,
     limit: int = Query(50, ge=1, le=500),
     offset: int = Query(0, ge=0),
     is_valid: Optional[bool] = Query(None),
@@ -310,47 +330,50 @@ def list_items(
     missing_ref: Optional[bool] = Query(None),
     db: Session = Depends(get_db),
 ):
-    q = db.query(InvoiceLineItem).filter(InvoiceLineItem.invoice_id == invoice_id)
+    def build():
+        q = db.query(InvoiceLineItem).filter(InvoiceLineItem.invoice_id == invoice_id)
 
-    if is_valid is not None:
-        q = q.filter(InvoiceLineItem.is_valid == is_valid)
+        if is_valid is not None:
+            q = q.filter(InvoiceLineItem.is_valid == is_valid)
 
-    if fee_type_norm is not None:
-        if fee_type_norm == "__NULL__":
-            q = q.filter(InvoiceLineItem.fee_type_norm.is_(None))
-        else:
-            q = q.filter(InvoiceLineItem.fee_type_norm == fee_type_norm)
+        if fee_type_norm is not None:
+            if fee_type_norm == "__NULL__":
+                q = q.filter(InvoiceLineItem.fee_type_norm.is_(None))
+            else:
+                q = q.filter(InvoiceLineItem.fee_type_norm == fee_type_norm)
 
-    if missing_ref:
-        q = q.filter(
-            (InvoiceLineItem.tracking_ref.is_(None)) & (InvoiceLineItem.order_ref.is_(None))
-        )
+        if missing_ref:
+            q = q.filter(
+                (InvoiceLineItem.tracking_ref.is_(None)) & (InvoiceLineItem.order_ref.is_(None))
+            )
 
-    total = q.count()
-    rows = q.order_by(InvoiceLineItem.row_number.asc()).offset(offset).limit(limit).all()
+        total = q.count()
+        rows = q.order_by(InvoiceLineItem.row_number.asc()).offset(offset).limit(limit).all()
+
+        return {
+            "invoice_id": invoice_id,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "items": [
+                {
+                    "id": r.id,
+                    "row_number": r.row_number,
+                    "fee_type_raw": r.fee_type_raw,
+                    "fee_type_norm": r.fee_type_norm,
+                    "amount_raw": r.amount_raw,
+                    "amount_cents": r.amount_cents,
+                    "order_ref": r.order_ref,
+                    "tracking_ref": r.tracking_ref,
+                    "is_valid": r.is_valid,
+                    "error_code": r.error_code,
+                    "error_detail": r.error_detail,
+                }
+                for r in rows
+            ],
+        }
 
-    return {
-        "invoice_id": invoice_id,
-        "total": total,
-        "limit": limit,
-        "offset": offset,
-        "items": [
-            {
-                "id": r.id,
-                "row_number": r.row_number,
-                "fee_type_raw": r.fee_type_raw,
-                "fee_type_norm": r.fee_type_norm,
-                "amount_raw": r.amount_raw,
-                "amount_cents": r.amount_cents,
-                "order_ref": r.order_ref,
-                "tracking_ref": r.tracking_ref,
-                "is_valid": r.is_valid,
-                "error_code": r.error_code,
-                "error_detail": r.error_detail,
-            }
-            for r in rows
-        ],
-    }
+    return cached_json(request, invoice_scope(invoice_id), build)
 
 
 # -------------------------
@@ -373,6 +396,7 @@ def save_field_map(
 
     invoice.field_map_json = json.dumps(fmap)
     db.commit()
+    response_cache.bump(invoice_scope(invoice_id))
     return {"invoice_id": invoice_id, "field_map": fmap}
 
 
@@ -380,19 +404,22 @@ def save_field_map(
 # Fee mapping rules (editable)
 # -------------------------
 @app.get("/fee-maps")
-def list_fee_maps(db: Session = Depends(get_db)):
-    rows = db.query(FeeTypeMap).order_by(FeeTypeMap.priority.desc()).all()
-    return [
-        {
-            "id": r.id,
-            "pattern": r.pattern,
-            "match_type": r.match_type,
-            "normalized_type": r.normalized_type,
-            "priority": r.priority,
-            "enabled": r.enabled,
-        }
-        for r in rows
-    ]
+def list_fee_maps(request: Request, db: Session = Depends(get_db)):
+    def build():
+        rows = db.query(FeeTypeMap).order_by(FeeTypeMap.priority.desc()).all()
+        return [
+            {
+                "id": r.id,
+                "pattern": r.pattern,
+                "match_type": r.match_type,
+                "normalized_type": r.normalized_type,
+                "priority": r.priority,
+                "enabled": r.enabled,
+            }
+            for r in rows
+        ]
+
+    return cached_json(request, FEE_MAPS_SCOPE, build)
 
 
 @app.post("/fee-maps")
@@ -418,6 +445,134 @@ def create_fee_map(payload: Dict[str, Any] = Body(...), db: Session = Depends(ge
     db.add(row)
     db.commit()
     db.refresh(row)
+    response_cache.bump(FEE_MAPS_SCOPE, FEE_SUGGESTIONS_SCOPE)
+    return {"id": row.id}
+
+
+def load_fee_suggestion_inputs(db: Session) -> tuple[Dict[str, int], Dict[str, str]]:
+    """
+    (unknown_counts, known_types) for the suggestion index; two full-table
+    queries, so only called when FEE_SUGGESTIONS_SCOPE has moved on.
+    """
+    unknown_counts: Dict[str, int] = {}
+    unknown_rows = (
+        db.query(InvoiceLineItem.fee_type_raw, func.count(InvoiceLineItem.id))
+        .filter(
+            InvoiceLineItem.is_valid == True,
+            InvoiceLineItem.fee_type_norm.is_(None),
+        )
+        .group_by(InvoiceLineItem.fee_type_raw)
+        .all()
+    )
+    for raw, cnt in unknown_rows:
+        key = (raw or "").strip().lower()
+        if key:
+            unknown_counts[key] = unknown_counts.get(key, 0) + cnt
+
+    # Reference strings for "nearest type": already-normalized raw values,
+    # non-regex rule patterns and the normalized type names themselves.
+    known_types: Dict[str, str] = {}
+    known_rows = (
+        db.query(InvoiceLineItem.fee_type_raw, InvoiceLineItem.fee_type_norm)
+        .filter(InvoiceLineItem.fee_type_norm.isnot(None))
+        .distinct()
+        .all()
+    )
+    for raw, norm in known_rows:
+        known_types.setdefault((raw or "").strip().lower(), norm)
+    for m in db.query(FeeTypeMap).filter(FeeTypeMap.enabled == True).all():
+        if m.match_type != "regex":
+            known_types.setdefault(m.pattern.strip().lower(), m.normalized_type)
+        known_types.setdefault(m.normalized_type.strip().lower(), m.normalized_type)
+    known_types.pop("", None)
+
+    return unknown_counts, known_types
+
+
+@app.get("/fee-maps/suggestions")
+def suggest_fee_maps(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    min_similarity: float = Query(0.5, ge=0.1, le=1.0),
+    db: Session = Depends(get_db),
+):
+    """
+    Cluster distinct unknown fee_type_raw values (fee_type_norm IS NULL, all invoices)
+    and suggest exact/contains rules plus the nearest existing normalized types.
+    The trigram indexes are built once per FEE_SUGGESTIONS_SCOPE version.
+    """
+    def build():
+        index = get_suggestion_index(
+            response_cache.version(FEE_SUGGESTIONS_SCOPE),
+            lambda: load_fee_suggestion_inputs(db),
+        )
+        return {
+            "unknown_distinct_raw": len(index.unknown_counts),
+            "unknown_rows": sum(index.unknown_counts.values()),
+            "clusters": index.suggest(limit=limit, min_similarity=min_similarity),
+        }
+
+    return cached_json(request, FEE_SUGGESTIONS_SCOPE, build)
+
+
+# -------------------------
+# Rate card (contracted rate per normalized fee type)
+# -------------------------
+@app.get("/rate-cards")
+def list_rate_cards(db: Session = Depends(get_db)):
+    rows = db.query(RateCard).order_by(RateCard.fee_type_norm.asc(), RateCard.effective_from.desc()).all()
+    return [
+        {
+            "id": r.id,
+            "fee_type_norm": r.fee_type_norm,
+            "rate_cents": r.rate_cents,
+            "tolerance_cents": r.tolerance_cents,
+            "effective_from": r.effective_from.isoformat(),
+            "effective_to": r.effective_to.isoformat() if r.effective_to else None,
+        }
+        for r in rows
+    ]
+
+
+@app.post("/rate-cards")
+def create_rate_card(payload: Dict[str, Any] = Body(...), db: Session = Depends(get_db)):
+    """
+    payload: {fee_type_norm, rate: '$4.50', tolerance?: '$0.05', effective_from: 'YYYY-MM-DD', effective_to?: 'YYYY-MM-DD'}
+    """
+    fee_type_norm = (payload.get("fee_type_norm") or "").strip()
+    if not fee_type_norm:
+        raise HTTPException(400, "fee_type_norm is required")
+
+    rate = payload.get("rate")
+    if rate is None or rate == "":
+        raise HTTPException(400, "rate is required")
+    try:
+        rate_cents = parse_money_to_cents(str(rate))
+        tolerance = payload.get("tolerance")
+        tolerance_cents = parse_money_to_cents(str(tolerance)) if tolerance not in (None, "") else None
+    except ValueError as e:
+        raise HTTPException(400, f"rate/tolerance: {e}")
+    if rate_cents < 0 or (tolerance_cents is not None and tolerance_cents < 0):
+        raise HTTPException(400, "rate and tolerance must not be negative")
+
+    if not payload.get("effective_from"):
+        raise HTTPException(400, "effective_from is required")
+    effective_from = parse_iso_date(payload.get("effective_from"), "effective_from")
+    effective_to = parse_iso_date(payload["effective_to"], "effective_to") if payload.get("effective_to") else None
+    if effective_to and effective_to < effective_from:
+        raise HTTPException(400, "effective_to must be on or after effective_from")
+
+    row = RateCard(
+        fee_type_norm=fee_type_norm,
+        rate_cents=rate_cents,
+        tolerance_cents=tolerance_cents,
+        effective_from=effective_from,
+        effective_to=effective_to,
+    )
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    invalidate_rate_index()
     return {"id": row.id}
 
 
@@ -448,20 +603,105 @@ def normalize_invoice(invoice_id: int, db: Session = Depends(get_db)):
             unknown += 1
 
     db.commit()
+    response_cache.bump(invoice_scope(invoice_id), FEE_SUGGESTIONS_SCOPE)
     return {"invoice_id": invoice_id, "normalized": updated, "unknown": unknown}
 
 
+# -------------------------
+# Overcharge audit stage
+# -------------------------
+def audit_overcharges(db: Session, invoice_id: int, on: date, limit: int) -> Dict[str, Any]:
+    """
+    Compare amount_cents against the rate card in one set-based pass:
+    the rates in effect on `on` are resolved once from the in-memory index and
+    pushed into SQL as CASE expressions, so Postgres does the per-row work and
+    only the aggregate plus the top `limit` offending rows come back.
+    """
+    rates = get_rate_index(db).rates_on(on)
+    result: Dict[str, Any] = {
+        "as_of": on.isoformat(),
+        "rated_fee_types": len(rates),
+        "overcharge_rows": 0,
+        "overcharge_total_cents": 0,
+        "rows": [],
+    }
+    if not rates:
+        return result
+
+    fee = InvoiceLineItem.fee_type_norm
+    expected = case({k: r.rate_cents for k, r in rates.items()}, value=fee)
+    ceiling = case({k: r.rate_cents + r.tolerance_cents for k, r in rates.items()}, value=fee)
+    overcharge = InvoiceLineItem.amount_cents - expected
+
+    filters = (
+        InvoiceLineItem.invoice_id == invoice_id,
+        InvoiceLineItem.is_valid == True,
+        fee.in_(list(rates)),
+        InvoiceLineItem.amount_cents > ceiling,
+    )
+
+    count, total = db.query(func.count(InvoiceLineItem.id), func.coalesce(func.sum(overcharge), 0)).filter(*filters).one()
+    result["overcharge_rows"] = count
+    result["overcharge_total_cents"] = int(total)
+
+    if count and limit:
+        rows = (
+            db.query(
+                InvoiceLineItem.id,
+                InvoiceLineItem.row_number,
+                InvoiceLineItem.fee_type_raw,
+                InvoiceLineItem.fee_type_norm,
+                InvoiceLineItem.amount_cents,
+                InvoiceLineItem.order_ref,
+                InvoiceLineItem.tracking_ref,
+            )
+            .filter(*filters)
+            .order_by(overcharge.desc(), InvoiceLineItem.row_number.asc())
+            .limit(limit)
+            .all()
+        )
+        result["rows"] = [
+            {
+                "id": r.id,
+                "row_number": r.row_number,
+                "fee_type_raw": r.fee_type_raw,
+                "fee_type_norm": r.fee_type_norm,
+                "amount_cents": r.amount_cents,
+                "expected_cents": rates[r.fee_type_norm].rate_cents,
+                "tolerance_cents": rates[r.fee_type_norm].tolerance_cents,
+                "overcharge_cents": r.amount_cents - rates[r.fee_type_norm].rate_cents,
+                "rate_card_id": rates[r.fee_type_norm].rate_card_id,
+                "order_ref": r.order_ref,
+                "tracking_ref": r.tracking_ref,
+            }
+            for r in rows
+        ]
+
+    return result
+
+
 # -------------------------
 # MVP Audit (no persisted findings yet)
 # -------------------------
 @app.post("/invoices/{invoice_id}/audit")
-def audit_invoice(invoice_id: int, db: Session = Depends(get_db)):
+def audit_invoice(
+    invoice_id: int,
+    as_of: Optional[str] = Query(None),
+    overcharge_limit: int = Query(100, ge=0, le=1000),
+    db: Session = Depends(get_db),
+):
     """
     MVP audit:
     - Unknown fee type (fee_type_norm is null)
     - Duplicate charges by (fee_type_norm, amount_cents, ref_key)
       where ref_key = tracking_ref or order_ref (must exist to count duplicates)
+    - Overcharges: amount_cents above the rate card rate (+ tolerance) in effect
+      on as_of (defaults to the invoice upload date)
     """
+    invoice = db.get(InvoiceUpload, invoice_id)
+    if not invoice:
+        raise HTTPException(404, "Invoice not found")
+
     # unknown fee type
     unknown_count = db.query(InvoiceLineItem).filter(
         InvoiceLineItem.invoice_id == invoice_id,
@@ -469,26 +709,28 @@ def audit_invoice(invoice_id: int, db: Session = Depends(get_db)):
         InvoiceLineItem.fee_type_norm.is_(None),
     ).count()
 
-    items = db.query(InvoiceLineItem).filter(
-        InvoiceLineItem.invoice_id == invoice_id,
-        InvoiceLineItem.is_valid == True,
-    ).all()
+    # duplicates: every row beyond the first in each (fee_type_norm, amount_cents, ref_key) group
+    ref_key = func.coalesce(InvoiceLineItem.tracking_ref, InvoiceLineItem.order_ref)
+    dup_groups = (
+        db.query(func.count(InvoiceLineItem.id).label("n"))
+        .filter(
+            InvoiceLineItem.invoice_id == invoice_id,
+            InvoiceLineItem.is_valid == True,
+            ref_key.isnot(None),
+        )
+        .group_by(func.coalesce(InvoiceLineItem.fee_type_norm, ""), InvoiceLineItem.amount_cents, ref_key)
+        .having(func.count(InvoiceLineItem.id) > 1)
+        .subquery()
+    )
+    dup_count = int(db.query(func.coalesce(func.sum(dup_groups.c.n - 1), 0)).scalar())
 
-    seen = set()
-    dup_count = 0
-    for it in items:
-        ref_key = it.tracking_ref or it.order_ref
-        if not ref_key:
-            continue
-        key = (it.fee_type_norm or "", it.amount_cents, ref_key)
-        if key in seen:
-            dup_count += 1
-        else:
-            seen.add(key)
+    on = parse_iso_date(as_of, "as_of") if as_of else invoice.created_at.date()
+    overcharges = audit_overcharges(db, invoice_id, on, overcharge_limit)
 
     return {
         "invoice_id": invoice_id,
         "unknown_fee_type_rows": unknown_count,
         "duplicate_rows": dup_count,
+        "overcharges": overcharges,
         "note": "Next step: persist findings into an AuditFindings table.",
     }
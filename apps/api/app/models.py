@@ -1,6 +1,6 @@
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import String, Integer, DateTime, Date, ForeignKey, Text, Boolean
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from datetime import datetime
+from datetime import datetime, date
 from typing import Optional
 from .db import Base
 
@@ -55,3 +55,14 @@ class FeeTypeMap(Base):
     priority: Mapped[int] = mapped_column(Integer, default=0)
     enabled: Mapped[bool] = mapped_column(Boolean, default=True)
 
+
+class RateCard(Base):
+    __tablename__ = "rate_cards"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    fee_type_norm: Mapped[str] = mapped_column(String(128), index=True)
+    rate_cents: Mapped[int] = mapped_column(Integer)
+    tolerance_cents: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    effective_from: Mapped[date] = mapped_column(Date)
+    effective_to: Mapped[Optional[date]] = mapped_column(Date, nullable=True)  # inclusive; null = open-ended
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,112 @@
+import threading
+from bisect import bisect_right
+from datetime import date
+from typing import NamedTuple, Optional, Dict
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .models import RateCard
+
+
+class Rate(NamedTuple):
+    rate_card_id: int
+    fee_type_norm: str
+    rate_cents: int
+    tolerance_cents: int
+    effective_from: date
+    effective_to: Optional[date]  # inclusive; None = open-ended
+
+    def covers(self, on: date) -> bool:
+        return self.effective_from <= on and (self.effective_to is None or on <= self.effective_to)
+
+
+class RateIndex:
+    """
+    In-memory interval index over the rate card: per fee_type_norm, rates
+    sorted by effective_from, looked up with bisect.
+    If intervals overlap, the one that started most recently wins.
+
+    One index is cached per process (get_rate_index). It is dropped locally by
+    invalidate_rate_index() and, so that other workers notice writes too,
+    rebuilt whenever the table's (count, max id) stamp changes. Rate cards are
+    append-only through the API; in-place UPDATEs made directly in the DB are
+    not detected until the next insert or a restart.
+    """
+
+    def __init__(self, rates: list[Rate]):
+        self._starts: Dict[str, list[date]] = {}
+        self._rates: Dict[str, list[Rate]] = {}
+
+        by_type: Dict[str, list[Rate]] = {}
+        for r in rates:
+            by_type.setdefault(r.fee_type_norm, []).append(r)
+        for fee_type, rs in by_type.items():
+            rs.sort(key=lambda r: (r.effective_from, r.rate_card_id))
+            self._rates[fee_type] = rs
+            self._starts[fee_type] = [r.effective_from for r in rs]
+
+    def lookup(self, fee_type_norm: str, on: date) -> Optional[Rate]:
+        rs = self._rates.get(fee_type_norm)
+        if not rs:
+            return None
+        i = bisect_right(self._starts[fee_type_norm], on) - 1
+        while i >= 0:
+            if rs[i].covers(on):
+                return rs[i]
+            i -= 1
+        return None
+
+    def rates_on(self, on: date) -> Dict[str, Rate]:
+        """
+        {fee_type_norm: Rate} for every fee type with a rate in effect on `on`.
+        """
+        out = {}
+        for fee_type in self._rates:
+            r = self.lookup(fee_type, on)
+            if r:
+                out[fee_type] = r
+        return out
+
+
+# -------------------------
+# Process-wide cache (rebuilt when invalidated or the DB stamp moves)
+# -------------------------
+_cached: Optional[tuple[tuple, RateIndex]] = None
+_lock = threading.Lock()
+
+
+def invalidate_rate_index() -> None:
+    global _cached
+    with _lock:
+        _cached = None
+
+
+def _rate_card_stamp(db: Session) -> tuple:
+    count, max_id = db.query(func.count(RateCard.id), func.max(RateCard.id)).one()
+    return (count, max_id)
+
+
+def get_rate_index(db: Session) -> RateIndex:
+    global _cached
+    stamp = _rate_card_stamp(db)
+    cached = _cached
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with _lock:
+        if _cached is None or _cached[0] != stamp:
+            rows = db.query(RateCard).all()
+            index = RateIndex([
+                Rate(
+                    rate_card_id=r.id,
+                    fee_type_norm=r.fee_type_norm,
+                    rate_cents=r.rate_cents,
+                    tolerance_cents=r.tolerance_cents or 0,
+                    effective_from=r.effective_from,
+                    effective_to=r.effective_to,
+                )
+                for r in rows
+            ])
+            _cached = (stamp, index)
+        return _cached[1]
@@ -0,0 +1,300 @@
+import math
+import re
+import threading
+from collections import defaultdict
+from difflib import SequenceMatcher
+from itertools import islice
+from typing import Callable, Optional, Dict, Iterable
+
+# Shortest pattern we will ever suggest as a `contains` rule.
+# Anything shorter matches far too much ("fee", "chg", ...).
+MIN_CONTAINS_LEN = 4
+
+# Candidates verified per clustering seed; keeps suggest() interactive when
+# common trigrams ("surcharge", "zone") put most of the corpus in one posting list.
+MAX_SEED_CANDIDATES = 2000
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+# -------------------------
+# Trigram helpers
+# -------------------------
+def normalize_key(s: str) -> str:
+    """
+    Lowercase and collapse every run of non-alphanumerics into one space.
+    'Fuel-Surcharge  (FSC)' -> 'fuel surcharge fsc'
+    """
+    return _NON_ALNUM.sub(" ", (s or "").lower()).strip()
+
+
+def trigrams(s: str, pad: bool = True) -> set[str]:
+    """
+    Character trigrams of the normalized string (pg_trgm style padding).
+    With pad=False only interior trigrams are returned, which is what a
+    substring lookup needs: every one of them must appear in any string
+    that contains the substring.
+    """
+    t = normalize_key(s)
+    if pad:
+        t = f" {t} "
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+class TrigramIndex:
+    """
+    In-process inverted index: trigram -> ids of the strings containing it.
+
+    search() uses prefix filtering so it never compares against every key:
+    a key with Jaccard similarity >= t to the query must share at least one
+    of the query's (n - ceil(t * n) + 1) rarest trigrams, so only those
+    posting lists are scanned and the resulting candidates are verified.
+    """
+
+    def __init__(self):
+        self.keys: list[str] = []
+        self.grams: list[frozenset[str]] = []
+        self.postings: Dict[str, list[int]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str) -> int:
+        idx = len(self.keys)
+        grams = frozenset(trigrams(key))
+        self.keys.append(key)
+        self.grams.append(grams)
+        for g in grams:
+            self.postings[g].append(idx)
+        return idx
+
+    def _rarest_first(self, grams: Iterable[str]) -> list[str]:
+        return sorted(grams, key=lambda g: len(self.postings.get(g, ())))
+
+    def search(
+        self,
+        text: str,
+        min_similarity: float = 0.3,
+        limit: Optional[int] = None,
+        max_candidates: Optional[int] = None,
+        exclude: Optional[set[int]] = None,
+    ) -> list[tuple[int, float]]:
+        """
+        Return [(key_id, similarity)] with similarity >= min_similarity,
+        best first.
+
+        Exact unless max_candidates is set: then at most that many candidates
+        are verified, taken from the rarest posting lists first and, within a
+        list, in insertion order. Ids in `exclude` are never returned.
+        """
+        q = trigrams(text)
+        if not q:
+            return []
+
+        n = len(q)
+        # epsilon so float noise (0.28 * 25 = 7.000000000000001) can't shrink the prefix
+        prefix_len = n - math.ceil(min_similarity * n - 1e-9) + 1
+        # Jaccard >= t also bounds the key's trigram count to [t * n, n / t]
+        min_len = min_similarity * n - 1e-9
+        max_len = n / min_similarity + 1e-9 if min_similarity > 0 else math.inf
+
+        candidates: set[int] = set()
+        for g in self._rarest_first(q)[:max(prefix_len, 1)]:
+            posting = self.postings.get(g, ())
+            if max_candidates is not None and len(candidates) + len(posting) > max_candidates:
+                candidates.update(islice(posting, max_candidates - len(candidates)))
+                break
+            candidates.update(posting)
+        if exclude:
+            candidates -= exclude
+
+        hits = []
+        for idx in candidates:
+            other = self.grams[idx]
+            if not min_len <= len(other) <= max_len:
+                continue
+            shared = len(q & other)
+            sim = shared / (n + len(other) - shared)
+            if sim >= min_similarity:
+                hits.append((idx, sim))
+
+        hits.sort(key=lambda h: (-h[1], self.keys[h[0]]))
+        return hits[:limit] if limit else hits
+
+    def containing(self, substring: str) -> list[int]:
+        """
+        Ids of keys whose lowercased text contains `substring`
+        (same semantics as a `contains` FeeTypeMap rule).
+        """
+        needle = (substring or "").strip().lower()
+        if not needle:
+            return []
+
+        grams = trigrams(needle, pad=False)
+        if grams:
+            # Intersect the few rarest posting lists, then verify.
+            ordered = self._rarest_first(grams)
+            candidates = set(self.postings.get(ordered[0], ()))
+            for g in ordered[1:3]:
+                candidates &= set(self.postings.get(g, ()))
+        else:
+            candidates = set(range(len(self.keys)))
+
+        return [i for i in candidates if needle in self.keys[i].lower()]
+
+
+# -------------------------
+# Suggestion building
+# -------------------------
+def common_substring(strings: list[str]) -> str:
+    """
+    Longest substring shared by all strings (approximate: folded left to right).
+    """
+    if not strings:
+        return ""
+    common = strings[0]
+    for s in strings[1:]:
+        m = SequenceMatcher(None, common, s, autojunk=False).find_longest_match(0, len(common), 0, len(s))
+        common = common[m.a:m.a + m.size]
+        if len(common) < MIN_CONTAINS_LEN:
+            return ""
+    return common.strip()
+
+
+class FeeSuggestionIndex:
+    """
+    Trigram indexes over the unknown raw strings and the known reference
+    strings. Building is O(all strings) -- a few seconds at 300k distinct
+    strings -- so one instance is kept per process (see get_suggestion_index)
+    and only suggest() runs per request.
+
+    unknown_counts: {fee_type_raw (stripped, lowercased): row count} for rows with no fee_type_norm
+    known_types: {reference string: normalized_type} (already-normalized raw strings, rule patterns, type names)
+    """
+
+    def __init__(self, unknown_counts: Dict[str, int], known_types: Dict[str, str]):
+        self.unknown_counts = unknown_counts
+
+        # Unknowns go in most frequent first: ids double as the clustering
+        # seed order, and capped searches keep the highest-volume strings.
+        self.unknown_index = TrigramIndex()
+        for raw in sorted(unknown_counts, key=lambda k: (-unknown_counts[k], k)):
+            self.unknown_index.add(raw)
+
+        self.rows_by_id = [unknown_counts[k] for k in self.unknown_index.keys]
+        # contains-pattern coverage, memoized: many clusters share a substring
+        self._contains_coverage: Dict[str, Dict[str, int]] = {}
+
+        self.known_index = TrigramIndex()
+        self.known_norm: list[str] = []
+        for ref, norm in known_types.items():
+            self.known_index.add(ref)
+            self.known_norm.append(norm)
+
+    def _coverage(self, ids: Iterable[int]) -> Dict[str, int]:
+        ids = list(ids)
+        return {
+            "distinct_raw": len(ids),
+            "rows": sum(self.rows_by_id[i] for i in ids),
+        }
+
+    def contains_coverage(self, pattern: str) -> Dict[str, int]:
+        cov = self._contains_coverage.get(pattern)
+        if cov is None:
+            cov = self._coverage(self.unknown_index.containing(pattern))
+            self._contains_coverage[pattern] = cov
+        return cov
+
+    def suggest(self, limit: int = 20, min_similarity: float = 0.5, max_members: int = 20) -> list[Dict]:
+        """
+        Greedily clusters the unknown strings (most frequent first) and, for
+        each cluster, ranks the nearest normalized types and proposes
+        `exact`/`contains` patterns with their coverage.
+
+        Each seed verifies at most MAX_SEED_CANDIDATES strings, so cost is
+        O(limit * cap) rather than O(limit * N); on very repetitive vocabularies
+        a cluster may miss low-volume members, which then seed later clusters.
+        """
+        unknown_index = self.unknown_index
+        counts = self.unknown_counts
+        assigned: set[int] = set()
+        clusters = []
+
+        for seed in range(len(unknown_index)):
+            if len(clusters) >= limit:
+                break
+            if seed in assigned:
+                continue
+
+            seed_raw = unknown_index.keys[seed]
+            assigned.add(seed)
+            member_ids = [seed] + [
+                idx for idx, _ in unknown_index.search(
+                    seed_raw, min_similarity, max_candidates=MAX_SEED_CANDIDATES, exclude=assigned,
+                )
+            ]
+            assigned.update(member_ids)
+            member_ids.sort(key=lambda i: -counts[unknown_index.keys[i]])
+            members = [unknown_index.keys[i] for i in member_ids]
+
+            # Nearest existing normalized types (best similarity per type)
+            nearest: Dict[str, float] = {}
+            for idx, sim in self.known_index.search(seed_raw, min_similarity=0.2):
+                norm = self.known_norm[idx]
+                if sim > nearest.get(norm, 0.0):
+                    nearest[norm] = sim
+            nearest_types = [
+                {"normalized_type": norm, "similarity": round(sim, 3)}
+                for norm, sim in sorted(nearest.items(), key=lambda kv: -kv[1])[:3]
+            ]
+
+            patterns = [
+                {"match_type": "exact", "pattern": seed_raw, "coverage": self._coverage([seed])},
+            ]
+            if len(members) > 1:
+                sub = common_substring(members[:max_members])
+                if len(sub) >= MIN_CONTAINS_LEN:
+                    patterns.append({
+                        "match_type": "contains",
+                        "pattern": sub,
+                        "coverage": self.contains_coverage(sub),
+                    })
+
+            clusters.append({
+                "representative": seed_raw,
+                "members": [{"fee_type_raw": m, "rows": counts[m]} for m in members[:max_members]],
+                "distinct_raw": len(members),
+                "rows": sum(counts[m] for m in members),
+                "nearest_types": nearest_types,
+                "suggested_patterns": patterns,
+            })
+
+        clusters.sort(key=lambda c: -c["rows"])
+        return clusters
+
+
+# -------------------------
+# Process-wide cache, keyed by the caller's data version
+# (per process: writes handled by another worker are not seen)
+# -------------------------
+_cached: Optional[tuple[int, FeeSuggestionIndex]] = None
+_lock = threading.Lock()
+
+
+def get_suggestion_index(version: int, load: Callable[[], tuple[Dict[str, int], Dict[str, str]]]) -> FeeSuggestionIndex:
+    """
+    Return the index built for `version`, rebuilding via load() only when
+    the version has moved on. The rebuild (full-table queries plus index
+    build, seconds at 300k distinct strings) runs under the lock, so the first
+    request after an upload/normalize/fee-map write pays for it and
+    concurrent requests wait instead of building twice.
+    """
+    global _cached
+    cached = _cached
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _lock:
+        if _cached is None or _cached[0] != version:
+            _cached = (version, FeeSuggestionIndex(*load()))
+        return _cached[1]
@@ -0,0 +1,6 @@
+# Lets `python -m pytest apps/api/tests` from the repo root import `app`
+# the same way uvicorn does with --app-dir apps/api.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,68 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models, rates, suggestions
+from app.cache import response_cache
+from app.db import Base, get_db
+from app.main import app
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """
+    Fresh in-memory SQLite per test. Process-wide caches are reset too:
+    ids restart at 1, so stale rate/suggestion indexes could otherwise match.
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+    rates.invalidate_rate_index()
+    monkeypatch.setattr(suggestions, "_cached", None)
+    response_cache.clear()
+
+    session = Session()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def client(db):
+    app.dependency_overrides[get_db] = lambda: db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def invoice(db):
+    inv = models.InvoiceUpload(filename="test.csv", headers_json='["Fee","Amount"]', field_map_json="{}")
+    db.add(inv)
+    db.commit()
+    return inv
+
+
+@pytest.fixture
+def add_item(db, invoice):
+    def add(fee_type_norm, amount_cents, is_valid=True, tracking_ref=None, order_ref=None):
+        item = models.InvoiceLineItem(
+            invoice_id=invoice.id,
+            fee_type_raw=fee_type_norm or "unknown",
+            amount_raw=str(amount_cents),
+            amount_cents=amount_cents,
+            fee_type_norm=fee_type_norm,
+            tracking_ref=tracking_ref,
+            order_ref=order_ref,
+            is_valid=is_valid,
+        )
+        db.add(item)
+        return item
+
+    return add
@@ -0,0 +1,154 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.cache import ResponseCache, _etag_matches, cached_json, response_cache
+
+
+# -------------------------
+# ResponseCache / ETag matching
+# -------------------------
+def test_etag_matches_lists_and_weak_tags():
+    etag = '"abc-1-ff"'
+    assert _etag_matches(etag, etag)
+    assert _etag_matches(f"W/{etag}", etag)
+    assert _etag_matches(f'"other", {etag}', etag)
+    assert _etag_matches(f'"other",W/{etag}', etag)
+    assert not _etag_matches('"abc-2-ff"', etag)
+    assert not _etag_matches("*", etag)
+    assert not _etag_matches("", etag)
+    assert not _etag_matches(None, etag)
+
+
+def test_bump_changes_only_that_scopes_etag():
+    cache = ResponseCache()
+    a, b = cache.etag("invoice:1", "/x?"), cache.etag("invoice:2", "/x?")
+    cache.bump("invoice:1")
+    assert cache.etag("invoice:1", "/x?") != a
+    assert cache.etag("invoice:2", "/x?") == b
+    assert cache.etag("invoice:1", "/x?") != cache.etag("invoice:1", "/y?")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"  # a is now most recent
+    cache.put("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+
+
+def _request(path="/thing", query=b"", headers=()):
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query, "headers": list(headers)})
+
+
+def test_cached_json_does_not_cache_errors():
+    calls = []
+
+    def build():
+        calls.append(1)
+        raise HTTPException(404, "nope")
+
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            cached_json(_request("/missing-thing"), "test-errors", build)
+    assert len(calls) == 2
+
+
+def test_cached_json_hit_and_304():
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"ok": True}
+
+    first = cached_json(_request("/cached-thing"), "test-hits", build)
+    again = cached_json(_request("/cached-thing"), "test-hits", build)
+    assert first.body == again.body and len(calls) == 1
+
+    etag = first.headers["etag"]
+    not_modified = cached_json(_request("/cached-thing", headers=[(b"if-none-match", etag.encode())]), "test-hits", build)
+    assert not_modified.status_code == 304 and len(calls) == 1
+
+
+# -------------------------
+# Endpoints
+# -------------------------
+CSV = "Fee,Amount,Order\nFuel Surcharge,$5.00,A1\nPick Fee,$1.00,A2\n"
+
+
+@pytest.fixture
+def uploaded(client):
+    return client.post("/upload", files={"file": ("a.csv", CSV)}).json()["invoice_id"]
+
+
+def test_invoice_304_and_no_db_on_repeat(client, db, uploaded, monkeypatch):
+    first = client.get(f"/invoices/{uploaded}")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    def no_db(*args, **kwargs):
+        raise AssertionError("cache hit should not touch the DB")
+
+    monkeypatch.setattr(db, "get", no_db)
+    assert client.get(f"/invoices/{uploaded}").json() == first.json()
+    assert client.get(f"/invoices/{uploaded}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/invoices/{uploaded}", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+
+
+def test_field_map_save_invalidates_invoice(client, uploaded):
+    first = client.get(f"/invoices/{uploaded}")
+    etag = first.headers["etag"]
+
+    client.post(f"/invoices/{uploaded}/field-map", json={"fee_type_raw": "Fee", "amount": "Amount", "order_ref": "Order"})
+
+    after = client.get(f"/invoices/{uploaded}", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["etag"] != etag
+    assert after.json()["field_map"]["order_ref"] == "Order"
+
+
+def test_normalize_invalidates_items(client, uploaded):
+    client.post("/fee-maps", json={"pattern": "fuel", "normalized_type": "FUEL"})
+    first = client.get(f"/invoices/{uploaded}/items")
+    etag = first.headers["etag"]
+    assert all(i["fee_type_norm"] is None for i in first.json()["items"])
+
+    client.post(f"/invoices/{uploaded}/normalize")
+
+    after = client.get(f"/invoices/{uploaded}/items", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["etag"] != etag
+    assert after.json()["items"][0]["fee_type_norm"] == "FUEL"
+
+
+def test_fee_map_create_invalidates_list(client):
+    first = client.get("/fee-maps")
+    etag = first.headers["etag"]
+    assert client.get("/fee-maps", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/fee-maps", json={"pattern": "pick", "normalized_type": "PICK"})
+
+    after = client.get("/fee-maps", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["etag"] != etag
+    assert [m["normalized_type"] for m in after.json()] == ["PICK"]
+
+
+def test_query_params_are_escaped_in_cache_key(client, uploaded):
+    client.post("/fee-maps", json={"pattern": "fuel", "normalized_type": "X"})
+    client.post(f"/invoices/{uploaded}/normalize")
+
+    plain = client.get(f"/invoices/{uploaded}/items?fee_type_norm=X&limit=5")
+    smuggled = client.get(f"/invoices/{uploaded}/items?fee_type_norm=X%26limit%3D5")
+    assert plain.json()["total"] == 1
+    assert smuggled.json()["total"] == 0
+    assert plain.headers["etag"] != smuggled.headers["etag"]
+
+
+def test_missing_invoice_is_not_cached(client):
+    assert client.get("/invoices/999").status_code == 404
+    assert client.get("/invoices/999").status_code == 404
+    assert all(b"999" not in body for body in response_cache._entries.values())
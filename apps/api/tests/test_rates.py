@@ -0,0 +1,201 @@
+import random
+from datetime import date
+
+import pytest
+
+from app.main import audit_invoice, audit_overcharges
+from app.models import RateCard
+from app.rates import Rate, RateIndex, get_rate_index
+
+
+def _rate(id, fee, cents, start, end=None, tol=0):
+    return Rate(
+        rate_card_id=id,
+        fee_type_norm=fee,
+        rate_cents=cents,
+        tolerance_cents=tol,
+        effective_from=start,
+        effective_to=end,
+    )
+
+
+# -------------------------
+# RateIndex
+# -------------------------
+@pytest.fixture
+def index():
+    return RateIndex([
+        _rate(1, "PICK", 90, date(2024, 1, 1), date(2024, 6, 30)),
+        _rate(2, "PICK", 100, date(2024, 7, 1)),
+        # overlaps card 2 for March 2025 only; starts later, so it wins while active
+        _rate(3, "PICK", 80, date(2025, 3, 1), date(2025, 3, 31)),
+        _rate(4, "FUEL", 500, date(2024, 2, 1), date(2024, 2, 29)),
+    ])
+
+
+@pytest.mark.parametrize("on, expected", [
+    (date(2023, 12, 31), None),  # before any card
+    (date(2024, 1, 1), 1),       # effective_from is inclusive
+    (date(2024, 6, 30), 1),      # effective_to is inclusive
+    (date(2024, 7, 1), 2),
+    (date(2030, 1, 1), 2),       # open-ended
+    (date(2025, 2, 28), 2),
+    (date(2025, 3, 1), 3),       # overlap: most recent start wins
+    (date(2025, 3, 31), 3),
+    (date(2025, 4, 1), 2),       # overlapping card ended: fall back to the covering one
+])
+def test_lookup_boundaries_and_overlap(index, on, expected):
+    r = index.lookup("PICK", on)
+    assert (r.rate_card_id if r else None) == expected
+
+
+def test_lookup_gap_and_unknown_type(index):
+    assert index.lookup("FUEL", date(2024, 1, 31)) is None
+    assert index.lookup("FUEL", date(2024, 2, 29)).rate_card_id == 4
+    assert index.lookup("FUEL", date(2024, 3, 1)) is None
+    assert index.lookup("STORAGE", date(2024, 2, 15)) is None
+
+
+def test_rates_on_only_includes_types_in_effect(index):
+    assert {k: r.rate_card_id for k, r in index.rates_on(date(2024, 2, 15)).items()} == {"PICK": 1, "FUEL": 4}
+    assert {k: r.rate_card_id for k, r in index.rates_on(date(2024, 3, 1)).items()} == {"PICK": 1}
+    assert index.rates_on(date(2023, 1, 1)) == {}
+
+
+def test_get_rate_index_sees_rows_written_elsewhere(db):
+    db.add(RateCard(fee_type_norm="PICK", rate_cents=100, effective_from=date(2024, 1, 1)))
+    db.commit()
+    assert get_rate_index(db).lookup("PICK", date(2024, 5, 1)).rate_cents == 100
+
+    # No invalidate_rate_index(): as if another worker had inserted the card
+    db.add(RateCard(fee_type_norm="PICK", rate_cents=120, effective_from=date(2024, 4, 1)))
+    db.commit()
+    assert get_rate_index(db).lookup("PICK", date(2024, 5, 1)).rate_cents == 120
+
+
+# -------------------------
+# Overcharge stage
+# -------------------------
+def test_audit_overcharges_count_total_and_tolerance(db, invoice, add_item):
+    db.add_all([
+        RateCard(fee_type_norm="FUEL", rate_cents=500, tolerance_cents=10, effective_from=date(2024, 1, 1)),
+        RateCard(fee_type_norm="PICK", rate_cents=100, tolerance_cents=None, effective_from=date(2024, 1, 1)),
+    ])
+    add_item("FUEL", 505)                   # within tolerance
+    add_item("FUEL", 510)                   # exactly rate + tolerance: not flagged
+    add_item("FUEL", 511)                   # flagged, overcharge measured from the rate: 11
+    add_item("FUEL", 600)                   # 100
+    add_item("PICK", 100)                   # at rate
+    add_item("PICK", 101)                   # NULL tolerance = 0: 1
+    add_item("PICK", 50)                    # undercharge is not an overcharge
+    add_item("PICK", 9999, is_valid=False)  # invalid rows are ignored
+    add_item("STORAGE", 9999)               # no rate card
+    add_item(None, 9999)                    # unknown fee type
+    db.commit()
+
+    result = audit_overcharges(db, invoice.id, date(2024, 6, 1), limit=10)
+
+    assert result["rated_fee_types"] == 2
+    assert result["overcharge_rows"] == 3
+    assert result["overcharge_total_cents"] == 11 + 100 + 1
+    assert [(r["fee_type_norm"], r["amount_cents"], r["overcharge_cents"]) for r in result["rows"]] == [
+        ("FUEL", 600, 100),
+        ("FUEL", 511, 11),
+        ("PICK", 101, 1),
+    ]
+    assert result["rows"][-1]["tolerance_cents"] == 0
+
+
+def test_audit_overcharges_limit_and_no_rates(db, invoice, add_item):
+    for amount in (200, 300, 400):
+        add_item("PICK", amount)
+    db.commit()
+    assert audit_overcharges(db, invoice.id, date(2024, 6, 1), limit=10)["overcharge_rows"] == 0
+
+    db.add(RateCard(fee_type_norm="PICK", rate_cents=100, effective_from=date(2024, 1, 1)))
+    db.commit()
+    result = audit_overcharges(db, invoice.id, date(2024, 6, 1), limit=1)
+    assert result["overcharge_rows"] == 3
+    assert result["overcharge_total_cents"] == 100 + 200 + 300
+    assert [r["amount_cents"] for r in result["rows"]] == [400]
+
+    # before the card takes effect
+    assert audit_overcharges(db, invoice.id, date(2023, 12, 31), limit=10)["overcharge_rows"] == 0
+
+
+def test_create_rate_card_accepts_zero_rate(client):
+    r = client.post("/rate-cards", json={"fee_type_norm": "PICK", "rate": 0, "effective_from": "2024-01-01"})
+    assert r.status_code == 200
+    assert client.get("/rate-cards").json()[0]["rate_cents"] == 0
+
+    r = client.post("/rate-cards", json={"fee_type_norm": "PICK", "effective_from": "2024-01-01"})
+    assert r.status_code == 400
+
+
+def test_zero_rate_flags_every_charge(client, db, invoice, add_item):
+    add_item("PICK", 0)
+    add_item("PICK", 1)
+    db.commit()
+    client.post("/rate-cards", json={"fee_type_norm": "PICK", "rate": 0, "effective_from": "2024-01-01"})
+
+    result = client.post(f"/invoices/{invoice.id}/audit", params={"as_of": "2024-06-01"}).json()
+    assert result["overcharges"]["overcharge_rows"] == 1
+    assert result["overcharges"]["overcharge_total_cents"] == 1
+
+
+# -------------------------
+# Duplicate pass
+# -------------------------
+def _duplicates_reference(rows):
+    """
+    The original in-Python pass the GROUP BY replaced.
+    """
+    seen = set()
+    dup = 0
+    for r in rows:
+        if not r["is_valid"]:
+            continue
+        ref_key = r["tracking_ref"] or r["order_ref"]
+        if not ref_key:
+            continue
+        key = (r["fee_type_norm"] or "", r["amount_cents"], ref_key)
+        if key in seen:
+            dup += 1
+        else:
+            seen.add(key)
+    return dup
+
+
+def test_duplicate_count_matches_reference(db, invoice, add_item):
+    rnd = random.Random(3)
+    rows = []
+    for _ in range(1500):
+        row = {
+            "fee_type_norm": rnd.choice([None, "FUEL", "PICK"]),
+            "amount_cents": rnd.choice([100, 200]),
+            "tracking_ref": rnd.choice([None, "T1", "T2", "T3"]),
+            "order_ref": rnd.choice([None, "O1", "T1"]),
+            "is_valid": rnd.random() < 0.9,
+        }
+        rows.append(row)
+        add_item(**row)
+    db.commit()
+
+    result = audit_invoice(invoice.id, as_of=None, overcharge_limit=0, db=db)
+    assert result["duplicate_rows"] == _duplicates_reference(rows) > 0
+
+
+def test_duplicate_count_small_cases(db, invoice, add_item):
+    add_item("FUEL", 100, tracking_ref="T1")
+    add_item("FUEL", 100, tracking_ref="T1")              # dup
+    add_item("FUEL", 100, tracking_ref="T1")              # dup
+    add_item("FUEL", 100, order_ref="T1")                 # dup: ref_key falls back to order_ref
+    add_item("FUEL", 200, tracking_ref="T1")              # different amount
+    add_item(None, 100, tracking_ref="T1")                # different (unknown) fee type
+    add_item(None, 100, tracking_ref="T1")                # dup of the unknown one
+    add_item("FUEL", 100)                                 # no ref: never a duplicate
+    add_item("FUEL", 100)
+    add_item("FUEL", 100, tracking_ref="T1", is_valid=False)
+    db.commit()
+
+    assert audit_invoice(invoice.id, as_of=None, overcharge_limit=0, db=db)["duplicate_rows"] == 4
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from app.suggestions import TrigramIndex, FeeSuggestionIndex, trigrams
+
+
+def _corpus(n=3000, seed=7):
+    rnd = random.Random(seed)
+    words = ["fuel", "surcharge", "surchg", "resi", "residential", "delivery", "pick", "pack",
+             "fee", "pallet", "storage", "return", "label", "adj", "fsc", "-", "(", ")", "&"]
+    out = set()
+    while len(out) < n:
+        parts = [rnd.choice(words) for _ in range(rnd.randint(1, 4))]
+        if rnd.random() < 0.3:
+            parts.append(str(rnd.randint(0, 99)))
+        out.add(" ".join(parts).lower())
+    return sorted(out)
+
+
+def _jaccard(a, b):
+    ga, gb = trigrams(a), trigrams(b)
+    if not ga or not gb:
+        return 0.0
+    shared = len(ga & gb)
+    return shared / (len(ga) + len(gb) - shared)
+
+
+@pytest.fixture(scope="module")
+def index():
+    ix = TrigramIndex()
+    for key in _corpus():
+        ix.add(key)
+    return ix
+
+
+@pytest.mark.parametrize("min_similarity", [0.1, 0.3, 0.5, 0.7, 1.0])
+def test_search_matches_brute_force(index, min_similarity):
+    rnd = random.Random(int(min_similarity * 100))
+    queries = rnd.sample(index.keys, 40) + ["fuel surcharge", "resi delivery fee", "pick & pack", "zzz"]
+    for q in queries:
+        got = {idx: sim for idx, sim in index.search(q, min_similarity)}
+        expected = {
+            idx for idx, key in enumerate(index.keys)
+            if _jaccard(q, key) >= min_similarity
+        }
+        assert set(got) == expected, q
+        for idx, sim in got.items():
+            assert sim == pytest.approx(_jaccard(q, index.keys[idx]))
+
+
+@pytest.mark.parametrize("needle", ["fuel", "surch", "resi delivery", "e - (", "ck & pa", "fee 1", "zzz", "ab"])
+def test_containing_matches_brute_force(index, needle):
+    expected = {idx for idx, key in enumerate(index.keys) if needle in key}
+    assert set(index.containing(needle)) == expected
+
+
+def test_suggestions_cluster_and_cover():
+    unknown = {"fuel surcharge": 50, "fuel surchg": 3, "fuel surcharge fsc": 10, "pick fee": 9}
+    known = {"fuel": "FUEL", "pick & pack": "PICK_PACK"}
+    clusters = FeeSuggestionIndex(unknown, known).suggest(min_similarity=0.3)
+
+    top = clusters[0]
+    assert top["representative"] == "fuel surcharge"
+    assert top["rows"] == 63
+    assert top["nearest_types"][0]["normalized_type"] == "FUEL"
+    contains = [p for p in top["suggested_patterns"] if p["match_type"] == "contains"]
+    assert contains and contains[0]["coverage"]["rows"] == 63
+
+
+def test_search_prefix_bound_survives_float_noise():
+    # 25 query trigrams, 7 shared, Jaccard exactly 0.28; 0.28 * 25 is 7.000000000000001 in floats
+    ix = TrigramIndex()
+    ix.add("abcdefg")
+    query = "abcdefg hijklmnopqrstuvwx"
+    assert len(trigrams(query)) == 25
+    assert [idx for idx, _ in ix.search(query, 0.28)] == [0]
+
+
+def test_capped_search_is_subset_and_honours_exclude(index):
+    q = "fuel surcharge"
+    exact = dict(index.search(q, 0.3))
+    capped = dict(index.search(q, 0.3, max_candidates=50))
+    assert len(capped) <= 50
+    assert set(capped) <= set(exact)
+
+    excluded = set(list(exact)[:5])
+    assert not set(dict(index.search(q, 0.3, exclude=excluded))) & excluded
+
+
+def test_suggest_clusters_are_disjoint():
+    unknown = {key: i % 7 + 1 for i, key in enumerate(_corpus(1500, seed=11))}
+    clusters = FeeSuggestionIndex(unknown, {}).suggest(limit=50, min_similarity=0.3, max_members=10_000)
+    seen = set()
+    for c in clusters:
+        members = {m["fee_type_raw"] for m in c["members"]}
+        assert not members & seen
+        seen |= members